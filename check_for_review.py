@@ -12,7 +12,6 @@ GitPython
 
 """
 
-from rbtools.api.client import RBClient
 import optparse
 import sys
 import datetime
@@ -22,7 +21,7 @@ import subprocess
 from git import *
 
 from rbconfig import RB_USER, RB_PASSWORD
-from rbhelpers import get_reviews_for_branch, get_repository_id_by_name
+from rbhelpers import get_reviews_for_branch, get_repository_id_by_name, get_client, get_root
 
 def get_git_diffs(branchname, path, masterbranch, verbose=False):
     """
@@ -239,8 +238,8 @@ if __name__ == '__main__':
         print("ERROR: You must specify a branch (-b|--branch) to find reviews for")
         sys.exit(2)
 
-    client = RBClient(options.url, username=RB_USER, password=RB_PASSWORD)
-    root = client.get_root()
+    client = get_client(options.url, username=RB_USER, password=RB_PASSWORD, verbose=VERBOSE)
+    root = get_root(client, verbose=VERBOSE)
     if not root:
         print("Error - could not get RBClient root.")
         sys.exit(1)
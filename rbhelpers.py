@@ -1,5 +1,22 @@
 # helper methods to work with RBTools API
 
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from rbtools.api.client import RBClient
+from rbtools.api.factory import create_resource
+
+# where get_client() keeps session cookies and cached API data between runs
+RB_STATE_DIR = os.path.expanduser("~/.rbscripts")
+
+# seconds a cached API root resource is reused before it is fetched again
+ROOT_CACHE_MAX_AGE = 3600
+
+ROOT_MIME_TYPE = "application/vnd.reviewboard.org.root+json"
+
 def get_repository_id_by_name(root, repo_name, verbose=False):
     """
     Return the integer Repository ID for the given name.
@@ -35,17 +52,130 @@ def get_reviews_for_branch(root, repo, branch, verbose=False):
     @param repo string, repo to get reviews for
     @param branch string, branch to get reviews for
     """
+    reviews = get_reviews_by_branch(root, repo, verbose=verbose).get(branch.lower(), [])
+    if verbose:
+        for review in reviews:
+            print("\t\tfound review %s for branch %s" % (review.id, branch))
+    return reviews
+
+def get_reviews_by_branch(root, repo, verbose=False):
+    """
+    Gets all open reviews in the given repo, indexed by branch name,
+    iterating over the paged API results.
+
+    @param root RBClient root
+    @param repo string, repo to get reviews for
+    @return dict, lowercased branch name => list of reviews
+    """
     # get open reviews to a specified user, group, etc.
     args = {}
     args['repository'] = repo
+    # fetch the largest page the API allows, to keep the number of requests down
+    args['max_results'] = 200
 
     req = root.get_review_requests(**args)
-    reviews = []
     if verbose:
         print("\tfound %d open reviews for repository %s" % (req.total_results, repo))
-    for review in req:
-        if review.branch.lower() == branch.lower():
-            reviews.append(review)
+    index = {}
+    try:
+        while True:
+            for review in req:
+                index.setdefault(review.branch.lower(), []).append(review)
+            req = req.get_next()
+    except StopIteration:
+        pass
+    return index
+
+def _get_state_file(url, username, suffix, state_dir=None):
+    """
+    Return the path to a per-server, per-user state file in state_dir,
+    creating state_dir (mode 0700) if needed.
+
+    @param url string, reviewboard server url
+    @param username string, reviewboard username (or None)
+    @param suffix string, suffix (extension) of the state file
+    @param state_dir string, directory to keep state in, default RB_STATE_DIR
+    @return string
+    """
+    if state_dir is None:
+        state_dir = RB_STATE_DIR
+    try:
+        os.makedirs(state_dir, 0o700)
+    except OSError:
+        if not os.path.isdir(state_dir):
+            raise
+    os.chmod(state_dir, 0o700)
+    key = hashlib.sha1(("%s %s" % (url, username)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(state_dir, "%s.%s" % (key, suffix))
+
+def get_client(url, username=None, password=None, state_dir=None, verbose=False):
+    """
+    Return a RBClient for the given server that reuses the session cookie
+    saved by earlier invocations, only logging in with username/password
+    when the server rejects (or has expired) that session.
+
+    The cookie file and RBTools' HTTP cache are kept in state_dir, readable
+    only by the current user.
+
+    @param url string, reviewboard server url
+    @param username string, reviewboard username
+    @param password string, reviewboard password
+    @param state_dir string, directory to keep state in, default RB_STATE_DIR
+    @return RBClient
+    """
+    cookie_file = _get_state_file(url, username, "cookies", state_dir=state_dir)
+    if not os.path.exists(cookie_file):
+        os.close(os.open(cookie_file, os.O_WRONLY | os.O_CREAT, 0o600))
+    os.chmod(cookie_file, 0o600)
+    cache_file = _get_state_file(url, username, "cache.db", state_dir=state_dir)
+    if verbose:
+        print("\tusing cookie file %s and cache %s" % (cookie_file, cache_file))
+
+    def auth_callback(realm, uri, **kwargs):
+        if verbose:
+            print("\tsession not accepted, logging in to %s" % uri)
+        return (username, password)
+
+    # note that we do NOT pass username/password to RBClient; if we did,
+    # RBTools would discard the saved session cookie and log in again.
+    return RBClient(url, cookie_file=cookie_file, auth_callback=auth_callback,
+                    cache_location=cache_file)
+
+def get_root(client, max_age=ROOT_CACHE_MAX_AGE, state_dir=None, verbose=False):
+    """
+    Return the API root resource for a client from get_client(), reusing the
+    copy saved on disk by an earlier invocation if it is less than max_age
+    seconds old, and fetching (and saving) it otherwise.
+
+    @param client RBClient, as returned by get_client()
+    @param max_age integer, seconds to reuse a saved root; 0 to always fetch
+    @param state_dir string, directory to keep state in, default RB_STATE_DIR
+    @return RBClient root resource, or None if it could not be fetched
+    """
+    root_file = _get_state_file(client.url, None, "root.json", state_dir=state_dir)
+    try:
+        if max_age > 0 and time.time() - os.path.getmtime(root_file) < max_age:
+            with open(root_file) as fh:
+                cached = json.load(fh)
             if verbose:
-                print("\t\tfound review %s for branch %s" % (review.id, branch))
-    return reviews
+                print("\tusing cached API root from %s" % root_file)
+            return create_resource(client._transport, cached['payload'], cached['url'],
+                                   mime_type=ROOT_MIME_TYPE)
+    except (OSError, IOError, ValueError, KeyError):
+        # missing, unreadable or corrupt cache; just fetch it
+        pass
+
+    root = client.get_root()
+    if not root:
+        return root
+    if verbose:
+        print("\tfetched API root, saving to %s" % root_file)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(root_file))
+    try:
+        with os.fdopen(fd, "w") as fh:
+            json.dump({'url': root._url, 'payload': root.rsp}, fh)
+        os.rename(tmp, root_file)
+    except (OSError, IOError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return root
@@ -3,7 +3,8 @@
 A script using the ReviewBoard API Client
   <https://pypi.python.org/pypi/RBTools/0.2>
   <http://www.reviewboard.org/docs/rbtools/dev/api/>
-to submit the review for a specific branch, at a specific commit.
+to submit the review for a specific branch, at a specific commit,
+or to submit the reviews for all branches merged in a git commit range.
 
 requires:
 rbtools
@@ -11,15 +12,160 @@ GitPython
 
 """
 
-from rbtools.api.client import RBClient
 import optparse
 import sys
 import datetime
 import re
 import subprocess
+from multiprocessing.pool import ThreadPool
 
 from puppetconfig import RB_USER, RB_PASSWORD
-from rbhelpers import get_reviews_for_branch, get_repository_id_by_name
+from rbhelpers import get_reviews_for_branch, get_reviews_by_branch, get_repository_id_by_name, get_client, get_root
+
+# subjects of merge commits, as written by "git merge" and GitHub
+MERGE_SUBJECT_RES = [
+    re.compile(r"^Merge branch '([^']+)'"),
+    re.compile(r"^Merge remote-tracking branch '[^/']+/([^']+)'"),
+    re.compile(r"^Merge pull request #\d+ from [^/\s]+/(\S+)"),
+]
+
+def get_merged_branches(path, commit_range, verbose=False):
+    """
+    Find the branches merged into the mainline by the merge commits in a
+    git commit range, by parsing the merge commit subjects. Only first-parent
+    merges count, so merges inside the merged branches are ignored, and the
+    range's target branch itself is never returned.
+
+    @param path string, path to the local git checkout to use
+    @param commit_range string, git commit range, i.e. "abc123..origin/master"
+    @return list of (branch name, merge commit sha) tuples, newest first,
+            with only the latest merge of each branch
+    """
+    cmd = "git log --merges --first-parent --format='%%H %%s' %s" % commit_range
+    if verbose:
+        print("\t running command: %s" % cmd)
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True, cwd=path)
+    output = p.communicate()[0]
+    if p.returncode != 0:
+        return None
+
+    # the range's target, i.e. "origin/master" in "abc123..origin/master";
+    # excluded both with and without its remote name
+    target = re.split(r"\.\.\.?", commit_range)[-1].strip()
+    if target == "" or target == "HEAD":
+        cmd = "git rev-parse --abbrev-ref HEAD"
+        target = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True, cwd=path).communicate()[0].decode('utf-8').strip()
+    exclude = set([target.lower()])
+    if "/" in target:
+        exclude.add(target.split("/", 1)[1].lower())
+
+    branches = []
+    seen = set()
+    for line in output.decode('utf-8').split("\n"):
+        if line.strip() == "":
+            continue
+        sha, subject = line.strip().split(" ", 1)
+        for regex in MERGE_SUBJECT_RES:
+            m = regex.match(subject)
+            if m is None:
+                continue
+            branch = m.group(1)
+            if branch.lower() in exclude:
+                if verbose:
+                    print("\tignoring merge of target branch %s in commit %s" % (branch, sha))
+                break
+            if branch.lower() not in seen:
+                seen.add(branch.lower())
+                branches.append((branch, sha))
+            if verbose:
+                print("\tfound merge of branch %s in commit %s" % (branch, sha))
+            break
+    return branches
+
+def submit_review(review, message=None):
+    """
+    Mark a review as submitted, with an optional description.
+
+    @param review a RBClient Review resource
+    @param message string, review submit message/description
+    """
+    rb_data = {'status': 'submitted'}
+    if message:
+        rb_data['description'] = message
+
+    print("Submitting review %d" % review.id)
+    review.update(data=rb_data)
+
+def submit_reviews_for_range(root, repo, path, commit_range, message=None, jobs=4, verbose=False):
+    """
+    Submit the open reviews for every branch merged in commit_range,
+    using one listing of the repository's open reviews and submitting
+    up to jobs reviews concurrently.
+
+    @param root RBClient root
+    @param repo integer, ReviewBoard repository id
+    @param path string, path to the local git checkout to use
+    @param commit_range string, git commit range
+    @param message string, review submit message/description; defaults to
+                   one naming the merge commit
+    @param jobs integer, number of reviews to submit concurrently
+    @return integer exit code; the first error found wins, so a branch with
+            multiple open reviews (5) takes precedence over a failed
+            submission (1)
+    """
+    branches = get_merged_branches(path, commit_range, verbose=verbose)
+    if branches is None:
+        print("ERROR: Could not get merge commits for range %s in %s" % (commit_range, path))
+        return 2
+    if len(branches) == 0:
+        print("No merged branches found in range %s" % commit_range)
+        return 0
+
+    index = get_reviews_by_branch(root, repo, verbose=verbose)
+    ret = 0
+    to_submit = []
+    for branch, sha in branches:
+        reviews = index.get(branch.lower(), [])
+        if len(reviews) == 0:
+            print("No open reviews found for branch %s in repo %s, skipping" % (branch, repo))
+            continue
+        if len(reviews) > 1:
+            print("ERROR: Multiple open reviews found for branch %s in repo %s" % (branch, repo))
+            ret = 5
+            continue
+        print("Found review %d for branch %s" % (reviews[0].id, branch))
+        to_submit.append((reviews[0], message or "Merged in commit %s" % sha))
+
+    def _submit(item):
+        try:
+            submit_review(*item)
+        except Exception as e:
+            print("ERROR: Could not submit review %d: %s" % (item[0].id, e))
+            return False
+        return True
+
+    if to_submit:
+        # RBTools saves the cookie jar to disk after every request, and the
+        # saves aren't locked; so don't save from the pool threads (which
+        # share the jar in memory), and save once here when they're done.
+        server = root._transport.server
+        save_cookies = server.save_cookies
+        server.save_cookies = False
+        pool = ThreadPool(max(1, min(jobs, len(to_submit))))
+        try:
+            results = pool.map(_submit, to_submit)
+        finally:
+            pool.close()
+            pool.join()
+            server.save_cookies = save_cookies
+            if save_cookies:
+                try:
+                    server.cookie_jar.save()
+                except IOError:
+                    pass
+        if not all(results) and ret == 0:
+            ret = 1
+    return ret
 
 if __name__ == '__main__':
     # if the program is executed directly parse the command line options
@@ -41,6 +187,16 @@ if __name__ == '__main__':
     parser.add_option('-m', '--message', dest='message', action="store", type="string",
                       help='review submit message/description')
 
+    parser.add_option('-R', '--range', dest='commit_range', action="store", type="string",
+                      help='submit reviews for all branches merged in this git commit range, '
+                      'i.e. "abc123..origin/master" (instead of -b|--branch)')
+
+    parser.add_option('-g', '--git-dir', dest='git_path', action="store", type="string",
+                      help='absolute path to a git checkout of the repository (with -R|--range)')
+
+    parser.add_option('-j', '--jobs', dest='jobs', default=4, action="store", type="int",
+                      help='with -R|--range, submit this many reviews concurrently (default 4)')
+
     options, args = parser.parse_args()
 
     VERBOSE = False
@@ -55,12 +211,20 @@ if __name__ == '__main__':
         print("ERROR: You must specify a repo (-r|--repo) to find reviews for")
         sys.exit(2)
 
-    if not options.branch:
-        print("ERROR: You must specify a branch (-b|--branch) to find reviews for")
+    if options.branch and options.commit_range:
+        print("ERROR: You must specify only one of a branch (-b|--branch) or commit range (-R|--range)")
         sys.exit(2)
 
-    client = RBClient(options.url, username=RB_USER, password=RB_PASSWORD)
-    root = client.get_root()
+    if not options.branch and not options.commit_range:
+        print("ERROR: You must specify a branch (-b|--branch) or commit range (-R|--range) to find reviews for")
+        sys.exit(2)
+
+    if options.commit_range and not options.git_path:
+        print("ERROR: You must specify the path to a git checkout of the repository (-g|--git-dir) with -R|--range")
+        sys.exit(2)
+
+    client = get_client(options.url, username=RB_USER, password=RB_PASSWORD, verbose=VERBOSE)
+    root = get_root(client, verbose=VERBOSE)
     if not root:
         print("Error - could not get RBClient root.")
         sys.exit(1)
@@ -70,6 +234,10 @@ if __name__ == '__main__':
         print("ERROR: Could not find ReviewBoard repository with name '%s'" % options.repo)
         sys.exit(3)
 
+    if options.commit_range:
+        sys.exit(submit_reviews_for_range(root, repo, options.git_path, options.commit_range,
+                                          message=options.message, jobs=options.jobs, verbose=VERBOSE))
+
     reviews = get_reviews_for_branch(root, repo, options.branch, verbose=VERBOSE)
     if len(reviews) == 0:
         print("ERROR: No open reviews found for branch %s in repo %s" % (options.branch, repo))
@@ -82,9 +250,4 @@ if __name__ == '__main__':
     review = reviews[0]
     print("Found review %d" % review.id)
 
-    rb_data = {'status': 'submitted'}
-    if options.message:
-        rb_data['description'] = options.message
-
-    print("Submitting review %d" % review.id)
-    review.update(data=rb_data)
+    submit_review(review, options.message)
@@ -6,12 +6,109 @@ or channel (using a channel-to-group mapping).
 from rbtools.api.client import RBClient
 from rbconfig import RB_URL
 import re
+import threading
+import Queue
 
 MAX_RESULTS_CHANNEL = 5
 MAX_RESULTS_PM = 10
 
 CHANNEL_GROUP_MAPPING = {'#tech-ops': 'Ops', '#automation': 'automation'}
 
+# number of background threads doing ReviewBoard lookups
+LOOKUP_WORKERS = 2
+
+# seconds to wait for a lookup before telling the waiters it timed out
+LOOKUP_TIMEOUT = 30
+
+_lookup_queue = Queue.Queue()
+_lookups = {}
+_lookups_lock = threading.Lock()
+_workers = []
+
+class Lookup(object):
+    """
+    A pending get_open_reviews() query, and the callbacks waiting on it.
+    """
+
+    def __init__(self, key, args):
+        self.key = key
+        self.args = args
+        self.callbacks = []
+        self.timer = None
+
+def _finish_lookup(lookup, result):
+    """
+    If lookup is still in flight, stop tracking it and pass result
+    to all of its callbacks. Otherwise (it already finished or timed
+    out) do nothing.
+    """
+    with _lookups_lock:
+        if _lookups.get(lookup.key) is not lookup:
+            return
+        del _lookups[lookup.key]
+    lookup.timer.cancel()
+    for callback in lookup.callbacks:
+        try:
+            callback(result)
+        except Exception as e:
+            print "Error in review lookup callback: %s" % e
+
+def _lookup_worker():
+    """
+    Thread target; run queued lookups forever.
+    """
+    while True:
+        lookup = _lookup_queue.get()
+        with _lookups_lock:
+            if _lookups.get(lookup.key) is not lookup:
+                # timed out while queued; its waiters have been told already
+                continue
+        try:
+            result = get_open_reviews(dict(lookup.args))
+        except Exception as e:
+            print "Error getting open reviews for %s: %s" % (lookup.args, e)
+            result = False
+        _finish_lookup(lookup, result)
+
+def start_lookup_workers():
+    """
+    Start the background lookup threads, if they aren't running already.
+    """
+    with _lookups_lock:
+        while len(_workers) < LOOKUP_WORKERS:
+            t = threading.Thread(target=_lookup_worker, name="reviews-lookup-%d" % len(_workers))
+            t.daemon = True
+            t.start()
+            _workers.append(t)
+
+def get_open_reviews_async(args, callback):
+    """
+    Queue a get_open_reviews(args) query to run in the background, and call
+    callback with its result (or None if it takes more than LOOKUP_TIMEOUT
+    seconds). An identical query that is already in flight is shared
+    rather than run again.
+
+    @param args dict, arguments for get_open_reviews()
+    @param callback callable, taking the get_open_reviews() result
+    """
+    start_lookup_workers()
+    key = tuple(sorted(args.items()))
+    with _lookups_lock:
+        lookup = _lookups.get(key)
+        if lookup is not None:
+            lookup.callbacks.append(callback)
+            return
+        lookup = Lookup(key, args)
+        lookup.callbacks.append(callback)
+        lookup.timer = threading.Timer(LOOKUP_TIMEOUT, _finish_lookup, (lookup, None))
+        lookup.timer.daemon = True
+        _lookups[key] = lookup
+    lookup.timer.start()
+    _lookup_queue.put(lookup)
+
+def setup(willie):
+    start_lookup_workers()
+
 def get_open_reviews(args):
     """
     get open reviews to a specified user, group, etc.
@@ -45,14 +142,24 @@ def get_res_limit(sender):
 
 def reviews_get(willie, trigger, for_type, spec):
     """
-    Return a list of reviews for a user or group
+    Look up a list of reviews for a user or group in the background,
+    and say them when the lookup finishes
     """
     max_res = get_res_limit(trigger.sender)
     if for_type == 'user':
-        l = get_open_reviews({'to_users': spec, 'max_results': max_res})
+        args = {'to_users': spec, 'max_results': max_res}
     else:
-        l = get_open_reviews({'to_groups': spec, 'max_results': max_res})
+        args = {'to_groups': spec, 'max_results': max_res}
+
+    get_open_reviews_async(args, lambda l: reviews_say(willie, for_type, spec, max_res, l))
 
+def reviews_say(willie, for_type, spec, max_res, l):
+    """
+    Say the result of a get_open_reviews() lookup for a user or group
+    """
+    if l is None:
+        willie.say("Timed out getting reviews for %s %s." % (for_type, spec))
+        return True
     if l is False:
         willie.say("Error getting reviews for %s %s." % (for_type, spec))
         return True